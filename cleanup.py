@@ -3,39 +3,113 @@
 IRL Hunts - Cleanup Utility
 Cleans up old sighting photos and temporary files.
 
-Run: python cleanup.py [--all] [--sightings] [--profiles]
+Run: python cleanup.py [--all] [--sightings] [--profiles DAYS] [--workers N]
 """
 
 import os
-import glob
+import sys
+import time
 import argparse
-from datetime import datetime, timedelta
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 
-def cleanup_sightings(upload_dir):
-    """Remove all sighting photos"""
-    files = glob.glob(os.path.join(upload_dir, "sighting_*"))
+# unlink/stat relative to an open directory fd (not available on Windows)
+HAVE_DIR_FD = hasattr(os, "O_DIRECTORY") and {os.unlink, os.stat} <= os.supports_dir_fd
+
+@contextmanager
+def _open_upload_dir(upload_dir):
+    """Open upload_dir once so per-file syscalls skip re-resolving its path"""
+    if not HAVE_DIR_FD:
+        yield None
+        return
+    dir_fd = os.open(upload_dir, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        yield dir_fd
+    finally:
+        os.close(dir_fd)
+
+def _scandir_prefix(upload_dir, prefix=""):
+    """List entries in upload_dir whose name starts with prefix (skips hidden files)"""
+    with os.scandir(upload_dir) as it:
+        return [e for e in it if e.name.startswith(prefix) and not e.name.startswith(".")]
+
+def _targets(upload_dir, prefix, dir_fd):
+    """Names relative to dir_fd, or full paths when no dir_fd is open"""
+    entries = _scandir_prefix(upload_dir, prefix)
+    if dir_fd is None:
+        return [e.path for e in entries]
+    return [e.name for e in entries]
+
+def _report_errors(errors):
+    """Write collected per-file errors to stderr in a single write"""
+    if errors:
+        sys.stderr.write("\n".join(errors) + "\n")
+        sys.stderr.flush()
+
+def _remove_batch(files, dir_fd, errors):
+    """Unlink each file in turn, returning how many were removed"""
+    unlink = os.unlink
     count = 0
     for f in files:
         try:
-            os.remove(f)
+            unlink(f, dir_fd=dir_fd)
             count += 1
-        except Exception as e:
-            print(f"  ⚠️ Could not remove {f}: {e}")
+        except OSError as e:
+            errors.append(f"  ⚠️ Could not remove {f}: {e}")
     return count
 
-def cleanup_old_profiles(upload_dir, days=7):
-    """Remove profile pics older than X days"""
-    cutoff = datetime.now() - timedelta(days=days)
-    files = glob.glob(os.path.join(upload_dir, "profile_*"))
+def remove_files(files, errors, workers=1, dir_fd=None):
+    """Remove a batch of files, returning how many were removed; failures are appended to errors"""
+    if workers > 1 and len(files) > 1:
+        # Split into one strided slice per worker and remove them concurrently
+        chunks = [files[i::workers] for i in range(workers)]
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            return sum(ex.map(lambda chunk: _remove_batch(chunk, dir_fd, errors), chunks))
+    return _remove_batch(files, dir_fd, errors)
+
+def cleanup_all(upload_dir, workers=1):
+    """Remove every uploaded file"""
+    errors = []
+    try:
+        with _open_upload_dir(upload_dir) as dir_fd:
+            return remove_files(_targets(upload_dir, "", dir_fd), errors, workers, dir_fd)
+    finally:
+        _report_errors(errors)
+
+def cleanup_sightings(upload_dir, workers=1):
+    """Remove all sighting photos"""
+    errors = []
+    try:
+        with _open_upload_dir(upload_dir) as dir_fd:
+            return remove_files(_targets(upload_dir, "sighting_", dir_fd), errors, workers, dir_fd)
+    finally:
+        _report_errors(errors)
+
+def _check_and_remove(path, cutoff, dir_fd, errors):
+    """Remove path if its mtime is older than cutoff (epoch seconds), returning 1 if removed"""
+    try:
+        if os.stat(path, dir_fd=dir_fd, follow_symlinks=False).st_mtime < cutoff:
+            os.unlink(path, dir_fd=dir_fd)
+            return 1
+    except OSError as e:
+        errors.append(f"  ⚠️ Could not process {path}: {e}")
+    return 0
+
+def cleanup_old_profiles(upload_dir, days=7, workers=32):
+    """Remove profile pics older than X days (stat+unlink run in parallel)"""
+    cutoff = time.time() - days * 86400
     count = 0
-    for f in files:
-        try:
-            mtime = datetime.fromtimestamp(os.path.getmtime(f))
-            if mtime < cutoff:
-                os.remove(f)
-                count += 1
-        except Exception as e:
-            print(f"  ⚠️ Could not process {f}: {e}")
+    errors = []
+    try:
+        with _open_upload_dir(upload_dir) as dir_fd:
+            paths = _targets(upload_dir, "profile_", dir_fd)
+            with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+                futures = [ex.submit(_check_and_remove, p, cutoff, dir_fd, errors) for p in paths]
+                for f in as_completed(futures):
+                    count += f.result()
+    finally:
+        _report_errors(errors)
     return count
 
 def main():
@@ -43,6 +117,7 @@ def main():
     parser.add_argument("--all", action="store_true", help="Remove all uploaded files")
     parser.add_argument("--sightings", action="store_true", help="Remove sighting photos only")
     parser.add_argument("--profiles", type=int, metavar="DAYS", help="Remove profiles older than X days")
+    parser.add_argument("--workers", type=int, default=32, metavar="N", help="Parallel stat/remove workers (default: 32)")
     
     args = parser.parse_args()
     
@@ -55,27 +130,23 @@ def main():
     print(f"📁 Upload directory: {upload_dir}")
     
     if args.all:
-        files = glob.glob(os.path.join(upload_dir, "*"))
-        files = [f for f in files if not f.endswith(".gitkeep")]
-        for f in files:
-            os.remove(f)
-        print(f"✅ Removed all {len(files)} files")
+        count = cleanup_all(upload_dir, args.workers)
+        print(f"✅ Removed all {count} files")
     elif args.sightings:
-        count = cleanup_sightings(upload_dir)
+        count = cleanup_sightings(upload_dir, args.workers)
         print(f"✅ Removed {count} sighting photos")
     elif args.profiles:
-        count = cleanup_old_profiles(upload_dir, args.profiles)
+        count = cleanup_old_profiles(upload_dir, args.profiles, args.workers)
         print(f"✅ Removed {count} profiles older than {args.profiles} days")
     else:
         print("No action specified. Use --help to see options.")
         
         # Show current usage
-        files = glob.glob(os.path.join(upload_dir, "*"))
-        sightings = len([f for f in files if "sighting_" in f])
-        profiles = len([f for f in files if "profile_" in f])
-        print(f"\nCurrent files: {len(files)} total")
-        print(f"  - Sighting photos: {sightings}")
-        print(f"  - Profile pics: {profiles}")
+        entries = _scandir_prefix(upload_dir)
+        kinds = Counter(e.name.partition("_")[0] for e in entries)
+        print(f"\nCurrent files: {len(entries)} total")
+        print(f"  - Sighting photos: {kinds['sighting']}")
+        print(f"  - Profile pics: {kinds['profile']}")
 
 if __name__ == "__main__":
     main()
@@ -15,21 +15,33 @@ Run with: python app.py
 Access at: http://YOUR_IP:5000
 """
 
-from flask import Flask, render_template, request, jsonify, session, send_from_directory
+from flask import Flask, Request, render_template, request, jsonify, session, send_from_directory
+from flask.json.provider import DefaultJSONProvider
 from flask_socketio import SocketIO, emit, join_room
 from werkzeug.utils import secure_filename
 from datetime import datetime, timedelta
-from functools import wraps
-from collections import defaultdict
+from functools import wraps, lru_cache
+from collections import defaultdict, deque
+from itertools import count, islice
+import heapq
+import queue
 import secrets
+import shutil
+import tempfile
 import time
 import threading
 import os
 import uuid
 import random
+import re
 import sys
 import hashlib
 
+try:
+    import orjson  # Optional: faster JSON for API responses and Socket.IO payloads
+except ImportError:
+    orjson = None
+
 # =============================================================================
 # LOAD CONFIGURATION
 # =============================================================================
@@ -70,8 +82,97 @@ except ImportError:
 # APP SETUP
 # =============================================================================
 
+class GameJSONProvider(DefaultJSONProvider):
+    """JSON provider that also serializes the deques and sets held in game state.
+
+    Uses orjson when installed, otherwise Flask's stdlib-based encoder.
+    """
+    sort_keys = False  # Clients don't rely on key order; sorting costs on every poll
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, (deque, set)):
+            return list(o)
+        return DefaultJSONProvider.default(o)
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None:
+            return super().dumps(obj, **kwargs)
+        option = orjson.OPT_NON_STR_KEYS
+        if kwargs.get("sort_keys", self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get("indent"):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        # Hand orjson's bytes straight to the response instead of going via str
+        obj = self._prepare_response_obj(args, kwargs)
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            option |= orjson.OPT_INDENT_2
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=option), mimetype=self.mimetype)
+
+class UploadRequest(Request):
+    """Request that spools uploaded files into the upload folder rather than RAM,
+    so store_upload() can hard-link them into place instead of copying."""
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # Hidden name: skipped by cleanup.py and the upload counters; removed when the request closes
+        return tempfile.NamedTemporaryFile(dir=UPLOAD_FOLDER, prefix=".upload-")
+
+# A configured key must be at least this long; shorter ones (typos, copied doc samples) are ignored
+MIN_SECRET_KEY_LENGTH = 32
+# Sample values shown in config_local.py.example, README.md and docs/; using them would make sessions forgeable
+PLACEHOLDER_SECRET_KEYS = {"paste_your_random_string_here", "random_32_character_string_here",
+                           "your_random_secret_key", "random_secret"}
+
+def configured_secret_key(value):
+    """value if it looks like a real secret, else None (unset, too short or a copied placeholder)"""
+    if not isinstance(value, str) or not value.strip():
+        return None
+    if value.strip() in PLACEHOLDER_SECRET_KEYS or len(value) < MIN_SECRET_KEY_LENGTH:
+        print(f"⚠️  Ignoring SECRET_KEY: use a random string of at least {MIN_SECRET_KEY_LENGTH} characters")
+        return None
+    return value
+
+def load_or_create_secret_key(path):
+    """Read the session secret from path, generating and saving one on first run.
+    The file is created exclusively, so concurrent first starts all end up with one key."""
+    for _ in range(50):
+        try:
+            with open(path) as f:
+                key = f.read().strip()
+            if key:
+                return key
+            time.sleep(0.02)  # Another process created it and is still writing the key
+            continue
+        except FileNotFoundError:
+            pass
+        key = secrets.token_hex(32)
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            continue  # Lost the race; read the winner's key
+        with os.fdopen(fd, "w") as f:
+            f.write(key)
+        return key
+    # Still empty (e.g. left behind by a crash): replace it
+    key = secrets.token_hex(32)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        f.write(key)
+    return key
+
 app = Flask(__name__)
-app.secret_key = os.environ.get('SECRET_KEY', secrets.token_hex(32))
+app.json = GameJSONProvider(app)
+app.request_class = UploadRequest
+# Keep the same secret across restarts so existing sessions stay valid
+app.secret_key = (configured_secret_key(os.environ.get('SECRET_KEY'))
+                  or configured_secret_key(globals().get('SECRET_KEY'))
+                  or load_or_create_secret_key(os.path.join(os.path.dirname(__file__), '.secret_key')))
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=12)
 
@@ -84,7 +185,19 @@ UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), 'uploads')
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
+class SocketIOJSON:
+    """json module stand-in for Socket.IO that always encodes through app.json (orjson, deques, sets).
+
+    flask.json only reaches the app's provider inside an app context, which background
+    threads (player flusher, countdown, timeouts) don't have; the provider itself doesn't need one.
+    """
+    @staticmethod
+    def dumps(obj, **kwargs):
+        return app.json.dumps(obj, **kwargs)
+
+    @staticmethod
+    def loads(s, **kwargs):
+        return app.json.loads(s, **kwargs)
 
 # =============================================================================
 # CONFIGURATION (loaded from config.py or config_local.py)
@@ -112,6 +225,26 @@ if 'MAX_EVENTS' not in dir():
     MAX_EVENTS = 1000
 if 'MAX_MESSAGES' not in dir():
     MAX_MESSAGES = 500
+if 'EVENT_LOG_FILE' not in dir():
+    EVENT_LOG_FILE = None  # Append-only JSON-lines copy of the event log (None = memory only)
+if 'TRACKER_KEY' not in dir():
+    TRACKER_KEY = None  # Shared secret letting trackers subscribe to their device room over Socket.IO
+# Let a front-end web server send upload bytes instead of streaming them through Python:
+# nginx via an internal location prefix (X-Accel-Redirect), Apache/lighttpd via X-Sendfile
+if 'UPLOADS_ACCEL_REDIRECT' not in dir():
+    UPLOADS_ACCEL_REDIRECT = None
+if 'USE_X_SENDFILE' not in dir():
+    USE_X_SENDFILE = False
+# Optional broker (e.g. redis://localhost:6379/0) so external emitters can reach our clients;
+# game state is per-process, so this does not make running several game servers possible
+if 'SOCKETIO_MESSAGE_QUEUE' not in dir():
+    SOCKETIO_MESSAGE_QUEUE = None
+# How often coalesced player changes are pushed to clients
+PLAYER_BATCH_MS = int(os.environ.get("PLAYER_BATCH_MS", PLAYER_BATCH_MS if 'PLAYER_BATCH_MS' in dir() else 50))
+
+app.config['USE_X_SENDFILE'] = bool(USE_X_SENDFILE)
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading', json=SocketIOJSON,
+                    message_queue=os.environ.get('SOCKETIO_MESSAGE_QUEUE') or SOCKETIO_MESSAGE_QUEUE)
 
 # =============================================================================
 # GAME MODES CONFIGURATION
@@ -227,18 +360,41 @@ game = {
         "allow_role_change": True,
     }
 }
+# game["end_time"] as a time.monotonic() deadline, see set_end_time(); process-local, so kept out of game
+end_deadline = None
 
 players = {}
+role_index = {"unassigned": set(), "pred": set(), "prey": set()}  # role -> device_ids, kept in sync by set_role()
+status_index = defaultdict(set)  # status -> device_ids, kept in sync by set_status()
+online_index = set()  # device_ids with online=True, kept in sync by set_online()
 beacons = {}
-events = []
-messages = []
+active_beacon_thresholds = {}  # beacon_id -> RSSI threshold for active beacons, see refresh_beacon_thresholds()
+events = deque(maxlen=MAX_EVENTS)
+sightings_log = deque(maxlen=500)  # Photo gallery, newest last (served by /api/sightings)
+messages = deque(maxlen=MAX_MESSAGES)
+# Recipient index: "all", "team_<name>", "role_<role>" or a device_id -> last 100 messages sent there
+message_boxes = defaultdict(lambda: deque(maxlen=100))
+message_ids = count(1)  # Message ids; next() is atomic, so concurrent sends never share one
 moderators = set()
 bounties = {}
-capture_cooldowns = {}
-sighting_cooldowns = {}  # Track sighting cooldowns per player-target pair
+capture_cooldowns = {}  # pred_id -> time.monotonic() of last capture
+sighting_cooldowns = {}  # Track sighting cooldowns per player-target pair (time.monotonic())
+# Min-heaps of (expires_at, key) so cleanup pops only the cooldowns that have run out
+capture_cooldown_heap = []
+sighting_cooldown_heap = []
 team_scores = {"Alpha": 0, "Beta": 0, "Gamma": 0, "Delta": 0}
 event_counter = 0
+notification_seq = 0
 background_thread_stop = False
+background_wake = threading.Event()  # Set to make background_tasks() re-check now (e.g. the end time moved)
+BACKGROUND_TICK = 5  # Seconds between player timeout / cooldown checks
+leaderboard_cache = {"at": 0.0, "data": None}  # See cached_leaderboard(); cleared by log_event()
+LEADERBOARD_TTL = 1.0  # Seconds a cached leaderboard may serve online/safe-zone flags
+event_log_queue = queue.SimpleQueue() if EVENT_LOG_FILE else None  # Drained by event_log_writer()
+event_log_thread = None
+dirty_players = set()  # device_ids changed since the last players_update flush
+dirty_players_lock = threading.Lock()
+players_lock = threading.Lock()  # Held while adding or removing players (see api_get_players)
 
 # Rate limiting
 login_attempts = defaultdict(list)  # IP -> list of timestamps
@@ -278,8 +434,31 @@ player_achievements = {}  # device_id -> set of achievement keys
 def now():
     return datetime.now().isoformat()
 
+time_str_cache = (None, "")  # (epoch second, now_str() text for that second)
+
 def now_str():
-    return datetime.now().strftime("%H:%M:%S")
+    # Second resolution, so format once per second and reuse it for every other caller
+    global time_str_cache
+    sec = int(time.time())
+    cached = time_str_cache
+    if cached[0] != sec:
+        cached = time_str_cache = (sec, time.strftime("%H:%M:%S", time.localtime(sec)))
+    return cached[1]
+
+def now_stamps():
+    """Return (now(), now_str()) from a single clock read"""
+    n = datetime.now()
+    return n.isoformat(), n.strftime("%H:%M:%S")
+
+# Consent badge indexed by bitmask: 1=touch OK (T), 2=no photo (NP), 4=no location (NL)
+CONSENT_BADGES = ("STD", "T", "NP", "TNP", "NL", "TNL", "NPNL", "TNPNL")
+
+def get_consent_badge(flags):
+    """Compact consent indicator for tracker/dashboard badges"""
+    mask = (int(bool(flags.get("physical_tag", False)))
+            | (not flags.get("photo_visible", True)) << 1
+            | (not flags.get("location_share", True)) << 2)
+    return CONSENT_BADGES[mask]
 
 def check_rate_limit(ip_address, limit_type="login"):
     """Check if IP is rate limited"""
@@ -361,6 +540,59 @@ def validate_game_action(required_phase=None, block_on_emergency=True):
         return False, "Action blocked: Emergency active"
     return True, "OK"
 
+def store_upload(file, filepath):
+    """Move an uploaded file to filepath: a hard link of its spool file, else a chunked copy"""
+    spool = getattr(file.stream, "name", None)
+    if isinstance(spool, str):
+        try:
+            os.chmod(spool, 0o644)  # Temp files are created 0600; keep uploads readable by a front-end server
+            os.link(spool, filepath)
+            return
+        except OSError:
+            pass
+    file.stream.seek(0)
+    with open(filepath, "wb") as out:
+        shutil.copyfileobj(file.stream, out, 1 << 20)
+
+def start_cooldown(cooldowns, expiry_heap, key, started, period):
+    """Record a cooldown starting at started (time.monotonic()) and queue its expiry"""
+    cooldowns[key] = started
+    heapq.heappush(expiry_heap, (started + period, key))
+
+def expire_cooldowns(cooldowns, expiry_heap, period):
+    """Drop cooldowns that have run out; heap entries for restarted or removed keys are skipped"""
+    current_time = time.monotonic()
+    while expiry_heap and expiry_heap[0][0] <= current_time:
+        _, key = heapq.heappop(expiry_heap)
+        started = cooldowns.get(key)
+        if started is not None and current_time - started >= period:
+            cooldowns.pop(key, None)
+
+def norm_id(value):
+    """Strip and upper-case an id from a request; ids from trackers usually already are"""
+    if value.isupper() and not value[:1].isspace() and not value[-1:].isspace():
+        return value
+    return value.strip().upper()
+
+def recent(items, limit):
+    """Last limit entries of a deque as a list without copying the rest (all if limit <= 0)"""
+    if limit <= 0:
+        return list(items)
+    tail = list(islice(reversed(items), limit))
+    tail.reverse()
+    return tail
+
+def set_end_time(seconds):
+    """Set the game to end seconds from now (or None), keeping the ISO end_time in step"""
+    global end_deadline
+    if seconds is None:
+        end_deadline = game["end_time"] = None
+    else:
+        # Timing uses the monotonic clock so wall-clock steps can't shorten or stretch a game
+        end_deadline = time.monotonic() + seconds
+        game["end_time"] = (datetime.now() + timedelta(seconds=seconds)).isoformat()
+    background_wake.set()
+
 def get_mode_config():
     return GAME_MODES.get(game["mode"], GAME_MODES["classic"])
 
@@ -371,18 +603,19 @@ def log_event(event_type, data, broadcast=True):
         "id": event_counter,
         "type": event_type,
         "data": data,
-        "timestamp": now(),
-        "time_str": now_str()
+        "ts_ms": int(time.time() * 1000)  # Clients format this for display
     }
     events.append(event)
-    if len(events) > MAX_EVENTS:
-        events.pop(0)
+    leaderboard_cache["data"] = None  # Score changes are always logged
+    if event_log_queue is not None:
+        event_log_queue.put(event)
     if broadcast:
         socketio.emit("event", event, room="all")
     
+    time_str = now_str()
     # Enhanced logging for emergencies
     if event_type == "emergency_triggered":
-        print(f"[{now_str()}] *** EMERGENCY ***")
+        print(f"[{time_str}] *** EMERGENCY ***")
         print(f"  Player: {data.get('player_name', 'Unknown')}")
         print(f"  Device: {data.get('device_id', 'Unknown')}")
         print(f"  Reason: {data.get('reason', 'Not specified')}")
@@ -391,17 +624,38 @@ def log_event(event_type, data, broadcast=True):
         if nearest:
             print(f"  Nearest players: {', '.join([f"{p['name']} ({p['rssi']}dB)" for p in nearest[:5]])}")
     else:
-        print(f"[{now_str()}] {event_type}: {data}")
+        print(f"[{time_str}] {event_type}: {data}")
     return event
 
 MAX_PLAYERS = 100  # Reasonable limit for memory/performance
+MAX_NOTIFICATIONS = 20  # Per player, oldest dropped first
+# Anything but letters, digits (Unicode, same as str.isalnum), spaces and _-.'!? is dropped from nicknames
+NICKNAME_DISALLOWED = re.compile(r"[^\w .'!?-]")
+# Pending notifications are stored as compact tuples and only expanded to dicts when read
+NOTIFICATION_FIELDS = ("seq", "message", "type", "time_str")
+broadcast_notifications = deque(maxlen=MAX_NOTIFICATIONS)
+# Server-side bookkeeping on player dicts (see pop_notifications() and touch_player()), never sent to clients
+PRIVATE_PLAYER_FIELDS = ("notifications", "notif_seq", "last_seen_sec")
+
+def public_player(player):
+    """Copy of player as sent to clients, without PRIVATE_PLAYER_FIELDS"""
+    public = dict(player)  # One C-level copy, so a concurrent writer can't break the iteration
+    for field in PRIVATE_PLAYER_FIELDS:
+        public.pop(field, None)
+    return public
 
 def get_player(device_id):
-    if device_id not in players:
+    player = players.get(device_id)
+    if player is not None:
+        return player
+    with players_lock:
+        player = players.get(device_id)  # Another request may have created it meanwhile
+        if player is not None:
+            return player
         if len(players) >= MAX_PLAYERS:
             # Don't create new player if at limit
             return None
-        players[device_id] = {
+        player = players[device_id] = {
             "device_id": device_id,
             "nickname": "",
             "name": f"Player_{device_id[-4:]}",
@@ -419,11 +673,13 @@ def get_player(device_id):
             "sightings": 0,
             "points": 0,
             "last_seen": now(),
+            "last_seen_sec": None,  # Epoch second last_seen was formatted for, see touch_player()
             "last_ping": time.time(),
             "last_rssi": {},
             "last_location_hint": "",
             "nearby_players": [],
-            "notifications": [],
+            "notifications": deque(maxlen=MAX_NOTIFICATIONS),
+            "notif_seq": notification_seq,  # Last broadcast notification already delivered
             "captured_by": None,
             "captured_by_device": None,
             "captured_prey": [],
@@ -437,64 +693,138 @@ def get_player(device_id):
             "ready": False,
             "phone_number": ""  # Emergency contact number (optional)
         }
-        log_event("player_join", {"id": device_id, "name": f"Player_{device_id[-4:]}"})
-    return players[device_id]
+    role_index["unassigned"].add(device_id)
+    status_index["offline"].add(device_id)
+    log_event("player_join", {"id": device_id, "name": f"Player_{device_id[-4:]}"})
+    return player
+
+def set_role(player, role):
+    """Change a player's role, keeping role_index in sync"""
+    role_index[player["role"]].discard(player["device_id"])
+    role_index[role].add(player["device_id"])
+    player["role"] = role
+
+def set_online(player, online):
+    """Change a player's online flag, keeping online_index in sync"""
+    if online:
+        online_index.add(player["device_id"])
+    else:
+        online_index.discard(player["device_id"])
+    player["online"] = online
+
+def touch_player(player):
+    """Record a ping; last_seen is only reformatted when the wall-clock second changes"""
+    t = time.time()
+    # Tracked separately from last_ping, which other handlers update without touching last_seen
+    if int(t) != player.get("last_seen_sec"):
+        player["last_seen"] = now()
+        player["last_seen_sec"] = int(t)
+    player["last_ping"] = t
+
+def set_status(player, status):
+    """Change a player's status, keeping status_index in sync"""
+    status_index[player["status"]].discard(player["device_id"])
+    status_index[status].add(player["device_id"])
+    player["status"] = status
+
+def role_players(role):
+    """Player dicts currently holding role"""
+    return [players[pid] for pid in role_index[role] if pid in players]
+
+def next_notification_seq():
+    global notification_seq
+    notification_seq += 1
+    return notification_seq
 
 def notify_player(device_id, message, msg_type="info"):
     if device_id in players:
-        notif = {"message": message, "type": msg_type, "time_str": now_str()}
+        notif = (next_notification_seq(), message, msg_type, now_str())
         players[device_id]["notifications"].append(notif)
-        if len(players[device_id]["notifications"]) > 20:
-            players[device_id]["notifications"].pop(0)
-        socketio.emit("notification", notif, room=device_id)
+        socketio.emit("notification", dict(zip(NOTIFICATION_FIELDS, notif)), room=device_id)
 
 def notify_all_players(message, msg_type="info"):
-    notif = {"message": message, "type": msg_type, "time_str": now_str()}
-    for device_id in players:
-        players[device_id]["notifications"].append(notif)
-        if len(players[device_id]["notifications"]) > 20:
-            players[device_id]["notifications"].pop(0)
-    socketio.emit("notification", notif, room="all")
-
-def calculate_points(player):
+    # Stored once and merged into each player's queue when they next read it
+    notif = (next_notification_seq(), message, msg_type, now_str())
+    broadcast_notifications.append(notif)
+    socketio.emit("notification", dict(zip(NOTIFICATION_FIELDS, notif)), room="all")
+
+def pop_notifications(player, limit=MAX_NOTIFICATIONS):
+    """Drain a player's pending notifications, including broadcasts since their last read.
+
+    Only the newest limit are returned; trackers poll this on every ping, usually with nothing queued.
+    """
+    since = player.get("notif_seq", 0)
+    own = player["notifications"]
+    broadcasts = list(broadcast_notifications)  # Snapshot; notify_all_players may append meanwhile
+    # Only mark broadcasts up to the newest one actually read as delivered
+    last = broadcasts[-1][0] if broadcasts else since
+    if not own and last <= since:
+        return []
+    pending = [n for n in broadcasts if since < n[0] <= last]
+    pending.extend(own.popleft() for _ in range(len(own)))  # Leaves anything queued meanwhile
+    pending.sort()
+    player["notif_seq"] = max(since, last)
+    return [dict(zip(NOTIFICATION_FIELDS, n)) for n in pending[-limit:]]
+
+def scoring_context():
+    """Game-wide inputs to calculate_points, computed once rather than per player"""
     mode_config = get_mode_config()
+    ended = game["phase"] == "ended"
+    prey_count = 0
+    if mode_config["infection"] and ended:
+        prey_count = len(role_index["prey"])
+    winning_team = None
+    if mode_config["team_mode"] and ended and team_scores:
+        top_team = max(team_scores, key=team_scores.get)
+        if team_scores[top_team] > 0:
+            winning_team = top_team
+    return mode_config, prey_count, winning_team
+
+@lru_cache(maxsize=4096)
+def points_for(mode, role, captures, escapes, sightings, infections, times_captured, ended, last_survivor, on_winning_team):
+    """Score for one stat line; cached since most players' stats repeat between leaderboard builds"""
+    mode_config = GAME_MODES.get(mode, GAME_MODES["classic"])
     pts = 0
     
-    if player["role"] == "pred":
-        pts += player["captures"] * mode_config["capture_points"]
-        if player["captures"] >= 3:
+    if role == "pred":
+        pts += captures * mode_config["capture_points"]
+        if captures >= 3:
             pts += mode_config["capture_bonus_3"]
-        if player["captures"] >= 5:
+        if captures >= 5:
             pts += mode_config["capture_bonus_5"]
-        pts += player["sightings"] * mode_config["sighting_points"]
+        pts += sightings * mode_config["sighting_points"]
         if mode_config["infection"]:
-            pts += player.get("infections", 0) * 25
-    elif player["role"] == "prey":
-        pts += player["escapes"] * mode_config["escape_points"]
-        pts += player["sightings"] * mode_config["sighting_points"]
-        if player["times_captured"] == 0 and game["phase"] == "ended":
+            pts += infections * 25
+    elif role == "prey":
+        pts += escapes * mode_config["escape_points"]
+        pts += sightings * mode_config["sighting_points"]
+        if times_captured == 0 and ended:
+            pts += mode_config["survival_bonus"]
+        if last_survivor:  # Last survivor (infection mode, game ended)
             pts += mode_config["survival_bonus"]
-        if mode_config["infection"] and game["phase"] == "ended":
-            prey_count = len([p for p in players.values() if p["role"] == "prey"])
-            if prey_count == 1 and player["role"] == "prey":
-                pts += mode_config["survival_bonus"]
     
     # Team winning bonus (calculated at game end)
-    if mode_config["team_mode"] and game["phase"] == "ended" and player.get("team"):
-        if team_scores:
-            winning_team = max(team_scores, key=team_scores.get)
-            if player["team"] == winning_team and team_scores[winning_team] > 0:
-                pts += 300  # Winning team bonus per member
+    if on_winning_team:
+        pts += 300  # Winning team bonus per member
     
+    return pts
+
+def calculate_points(player, context=None):
+    mode_config, prey_count, winning_team = context or scoring_context()
+    pts = points_for(
+        game["mode"], player["role"], player["captures"], player["escapes"], player["sightings"],
+        player.get("infections", 0), player["times_captured"], game["phase"] == "ended",
+        prey_count == 1, bool(winning_team) and player.get("team") == winning_team)
     player["points"] = pts
     return pts
 
 def get_leaderboard():
+    context = scoring_context()
     preds, prey = [], []
     for p in players.values():
         if p["role"] == "unassigned":
             continue
-        calculate_points(p)
+        calculate_points(p, context)
         entry = {
             "device_id": p["device_id"],
             "name": p["name"],
@@ -520,19 +850,28 @@ def get_leaderboard():
     prey.sort(key=lambda x: x["points"], reverse=True)
     
     teams = {}
-    if get_mode_config()["team_mode"]:
+    if context[0]["team_mode"]:
         teams = dict(team_scores)
     
     return {"preds": preds, "prey": prey, "teams": teams}
 
+def cached_leaderboard():
+    """get_leaderboard(), reused until the next logged event or LEADERBOARD_TTL passes"""
+    now_t = time.monotonic()
+    lb = leaderboard_cache["data"]
+    if lb is None or now_t - leaderboard_cache["at"] >= LEADERBOARD_TTL:
+        lb = get_leaderboard()
+        leaderboard_cache.update(at=now_t, data=lb)
+    return lb
+
 def assign_team(player):
     mode_config = get_mode_config()
     if not mode_config["team_mode"] or player["role"] != "pred":
         return
     
     team_sizes = {team: 0 for team in mode_config["teams"]}
-    for p in players.values():
-        if p["role"] == "pred" and p.get("team") in team_sizes:
+    for p in role_players("pred"):
+        if p.get("team") in team_sizes:
             team_sizes[p["team"]] += 1
     
     smallest_team = min(team_sizes, key=team_sizes.get)
@@ -567,17 +906,16 @@ def process_capture(pred_id, prey_id, rssi):
         if prey_id not in pred.get("has_photo_of", []):
             return False, "Must photograph prey first! Take a sighting photo before capture."
     
-    current_time = time.time()
-    if pred_id in capture_cooldowns:
-        time_since_last = current_time - capture_cooldowns[pred_id]
-        if time_since_last < CAPTURE_COOLDOWN:
-            return False, f"Wait {int(CAPTURE_COOLDOWN - time_since_last)}s"
+    current_time = time.monotonic()
+    time_since_last = current_time - capture_cooldowns.get(pred_id, float("-inf"))
+    if time_since_last < CAPTURE_COOLDOWN:
+        return False, f"Wait {int(CAPTURE_COOLDOWN - time_since_last)}s"
     
-    capture_cooldowns[pred_id] = current_time
+    start_cooldown(capture_cooldowns, capture_cooldown_heap, pred_id, current_time, CAPTURE_COOLDOWN)
     
     if mode_config["infection"]:
-        prey_p["role"] = "pred"
-        prey_p["status"] = "active"
+        set_role(prey_p, "pred")
+        set_status(prey_p, "active")
         prey_p["times_captured"] += 1
         pred["captures"] += 1
         pred["infections"] = pred.get("infections", 0) + 1
@@ -588,10 +926,10 @@ def process_capture(pred_id, prey_id, rssi):
         notify_all_players(f"🦠 {prey_p['name']} has been INFECTED!", "warning")
         socketio.emit("infection", {"pred": pred["name"], "prey": prey_p["name"]}, room="all")
         
-        prey_left = len([p for p in players.values() if p["role"] == "prey"])
+        prey_left = len(role_index["prey"])
         if prey_left == 0:
             game["phase"] = "ended"
-            game["end_time"] = now()
+            set_end_time(0)
             # Find top infector
             top_infector = max(players.values(), key=lambda p: p.get("infections", 0), default=None)
             top_name = top_infector["name"] if top_infector else "Unknown"
@@ -601,7 +939,7 @@ def process_capture(pred_id, prey_id, rssi):
         
         return True, f"Infected {prey_p['name']}! They're now a predator!"
     
-    prey_p["status"] = "captured"
+    set_status(prey_p, "captured")
     prey_p["times_captured"] += 1
     prey_p["captured_by"] = pred["name"]
     prey_p["captured_by_device"] = pred_id  # Track device ID too
@@ -655,7 +993,7 @@ def process_escape(prey_id, beacon_id=None):
     escaped_from = prey_p.get("captured_by", "")
     escaped_from_device = prey_p.get("captured_by_device", "")
     
-    prey_p["status"] = "active"
+    set_status(prey_p, "active")
     prey_p["escapes"] += 1
     prey_p["captured_by"] = None
     prey_p["captured_by_device"] = None
@@ -674,31 +1012,38 @@ def process_escape(prey_id, beacon_id=None):
     socketio.emit("escape", {"prey": prey_p["name"], "from": escaped_from}, room="all")
     return True
 
+def refresh_beacon_thresholds():
+    """Rebuild the active beacon -> threshold view after any beacon change"""
+    global active_beacon_thresholds
+    active_beacon_thresholds = {
+        bid: b.get("rssi", DEFAULT_SAFEZONE_RSSI)
+        for bid, b in beacons.items() if b.get("active", True)
+    }
+
 def update_safe_zone(device_id, beacon_rssi):
     player = players.get(device_id)
     if not player:
         return
     
     was_safe = player["in_safe_zone"]
+    if not beacon_rssi and not was_safe:
+        return
     is_safe = False
     nearest_beacon = None
     best_rssi = -999
     
-    # Track all detected beacons for debugging
-    detected_beacons = []
-    
+    thresholds = active_beacon_thresholds
     for beacon_id, rssi in beacon_rssi.items():
-        if beacon_id in beacons and beacons[beacon_id].get("active", True):
-            threshold = beacons[beacon_id].get("rssi", DEFAULT_SAFEZONE_RSSI)
-            detected_beacons.append(f"{beacon_id}:{rssi}dB(thresh:{threshold})")
-            if rssi >= threshold and rssi > best_rssi:
-                is_safe = True
-                nearest_beacon = beacon_id
-                best_rssi = rssi
-        elif beacon_id not in beacons:
-            # Unknown beacon detected - log for admin awareness
-            if beacon_id.startswith("SZ"):
+        threshold = thresholds.get(beacon_id)
+        if threshold is None:
+            if beacon_id not in beacons and beacon_id.startswith("SZ"):
+                # Unknown beacon detected - log for admin awareness
                 log_event("unknown_beacon", {"beacon_id": beacon_id, "rssi": rssi, "player": player["name"]}, broadcast=False)
+            continue
+        if rssi >= threshold and rssi > best_rssi:
+            is_safe = True
+            nearest_beacon = beacon_id
+            best_rssi = rssi
     
     if is_safe and not was_safe:
         player["in_safe_zone"] = True
@@ -776,14 +1121,13 @@ def check_player_timeouts():
         if player["online"]:
             time_since_ping = current_time - player.get("last_ping", 0)
             if time_since_ping > PLAYER_TIMEOUT:
-                player["online"] = False
+                set_online(player, False)
                 if game["phase"] == "running":
                     log_event("player_timeout", {"player": player["name"], "device_id": device_id})
 
 def check_game_end():
-    if game["phase"] == "running" and game["end_time"] and not game["emergency"]:
-        end_dt = datetime.fromisoformat(game["end_time"])
-        if datetime.now() >= end_dt:
+    if game["phase"] == "running" and end_deadline and not game["emergency"]:
+        if time.monotonic() >= end_deadline:
             game["phase"] = "ended"
             lb = get_leaderboard()
             log_event("game_auto_end", {"reason": "Timer expired"})
@@ -791,41 +1135,87 @@ def check_game_end():
             socketio.emit("game_ended", lb, room="all")
 
 def cleanup_old_cooldowns():
-    """Clean up old cooldown entries to prevent memory leak"""
-    current_time = time.time()
-    # Clean capture cooldowns older than 5 minutes (thread-safe copy)
-    try:
-        expired_captures = [k for k, v in list(capture_cooldowns.items()) if current_time - v > 300]
-        for k in expired_captures:
-            capture_cooldowns.pop(k, None)
-        # Clean sighting cooldowns older than 10 minutes
-        expired_sightings = [k for k, v in list(sighting_cooldowns.items()) if current_time - v > 600]
-        for k in expired_sightings:
-            sighting_cooldowns.pop(k, None)
-    except RuntimeError:
-        # Dictionary changed size during iteration - will clean next cycle
-        pass
+    """Clean up expired cooldown entries to prevent memory leak"""
+    expire_cooldowns(capture_cooldowns, capture_cooldown_heap, CAPTURE_COOLDOWN)
+    expire_cooldowns(sighting_cooldowns, sighting_cooldown_heap, SIGHTING_COOLDOWN)
 
 def background_tasks():
     global background_thread_stop
-    cleanup_counter = 0
     while not background_thread_stop:
         try:
             check_player_timeouts()
             check_game_end()
-            cleanup_counter += 1
-            if cleanup_counter >= 12:  # Every minute (12 * 5 seconds)
-                cleanup_old_cooldowns()
-                cleanup_counter = 0
+            cleanup_old_cooldowns()  # Only pops what has expired, so cheap enough every tick
         except Exception as e:
             print(f"[ERROR] Background task: {e}")
-        time.sleep(5)
+        # Sleep until the next tick, or until the game is due to end if that is sooner
+        timeout = BACKGROUND_TICK
+        if game["phase"] == "running" and end_deadline and not game["emergency"]:
+            timeout = max(0, min(timeout, end_deadline - time.monotonic()))
+        background_wake.wait(timeout)
+        background_wake.clear()
+
+def mark_player_dirty(device_id):
+    """Queue a player for the next batched players_update broadcast"""
+    with dirty_players_lock:
+        dirty_players.add(device_id)
+
+def flush_player_updates():
+    """Emit every player changed since the last flush as one players_update event"""
+    global dirty_players
+    with dirty_players_lock:
+        if not dirty_players:
+            return
+        drained, dirty_players = dirty_players, set()
+    batch = {pid: public_player(players[pid]) for pid in drained if pid in players}
+    if batch:
+        socketio.emit("players_update", batch, room="all")
+
+def player_update_flusher():
+    while not background_thread_stop:
+        socketio.sleep(PLAYER_BATCH_MS / 1000)
+        try:
+            flush_player_updates()
+        except Exception as e:
+            print(f"[ERROR] Player update flush: {e}")
+
+def event_log_writer():
+    """Append queued events to EVENT_LOG_FILE as JSON lines, with one fsync per batch.
+
+    A batch is whatever arrives within 50ms of its first event, up to 64 events.
+    Exits once stopped and the queue is empty.
+    """
+    with open(EVENT_LOG_FILE, "ab") as f:
+        while True:
+            try:
+                batch = [event_log_queue.get(timeout=0.05)]
+            except queue.Empty:
+                if background_thread_stop:
+                    return
+                continue
+            deadline = time.monotonic() + 0.05
+            while len(batch) < 64:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(event_log_queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                f.write("".join(app.json.dumps(e) + "\n" for e in batch).encode())
+                f.flush()
+                os.fsync(f.fileno())
+            except Exception as e:
+                print(f"[ERROR] Event log write: {e}")
 
 def start_background_thread():
-    global background_thread_stop
+    global background_thread_stop, event_log_thread
     background_thread_stop = False
-    thread = threading.Thread(target=background_tasks, daemon=True)
-    thread.start()
+    socketio.start_background_task(background_tasks)
+    socketio.start_background_task(player_update_flusher)
+    if event_log_queue is not None:
+        event_log_thread = socketio.start_background_task(event_log_writer)
 
 # =============================================================================
 # AUTH DECORATORS
@@ -876,7 +1266,7 @@ def dashboard():
     player = get_player(device_id)
     is_mod = device_id in moderators or session.get("is_admin", False)
     mode_config = get_mode_config()
-    return render_template("dashboard.html", player=player, is_mod=is_mod, 
+    return render_template("dashboard.html", player=public_player(player) if player else player, is_mod=is_mod, 
                           mode_config=mode_config, game_mode=game["mode"])
 
 @app.route("/admin")
@@ -886,6 +1276,13 @@ def admin():
 
 @app.route("/uploads/<filename>")
 def uploaded_file(filename):
+    if UPLOADS_ACCEL_REDIRECT:
+        if secure_filename(filename) != filename:
+            return jsonify({"error": "Not found"}), 404
+        resp = app.response_class()
+        resp.headers["X-Accel-Redirect"] = UPLOADS_ACCEL_REDIRECT.rstrip("/") + "/" + filename
+        del resp.headers["Content-Type"]  # nginx sets it from the file extension
+        return resp
     return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
 
 # =============================================================================
@@ -902,7 +1299,7 @@ def api_login():
         return jsonify({"error": msg}), 429
     
     data = request.json or {}
-    device_id = data.get("device_id", "").strip().upper()
+    device_id = norm_id(data.get("device_id", ""))
     
     # Input validation
     if not device_id or len(device_id) < 4:
@@ -922,15 +1319,15 @@ def api_login():
     
     if player is None:
         return jsonify({"error": "Server at capacity (max players reached)"}), 503
-    player["online"] = True
+    set_online(player, True)
     player["last_ping"] = time.time()
     if player["status"] == "offline":
-        player["status"] = "lobby"
+        set_status(player, "lobby")
     
     log_event("web_login", {"player": player["name"], "device": device_id})
     return jsonify({
         "success": True, 
-        "player": player, 
+        "player": public_player(player), 
         "session_token": session_token,
         "device_id": device_id
     })
@@ -970,7 +1367,7 @@ def api_admin_login():
 def api_logout():
     device_id = session.get("device_id")
     if device_id and device_id in players:
-        players[device_id]["online"] = False
+        set_online(players[device_id], False)
     session.clear()
     return jsonify({"success": True})
 
@@ -999,8 +1396,7 @@ def api_update_player():
     if "nickname" in data:
         nickname = str(data["nickname"]).strip()[:30]
         # Allow alphanumeric, spaces, underscores, hyphens, and common punctuation
-        nickname = "".join(c for c in nickname if c.isalnum() or c in " _-.'!?")
-        nickname = nickname.strip()
+        nickname = NICKNAME_DISALLOWED.sub("", nickname).strip()
         if len(nickname) < 2:
             nickname = ""
         if len(nickname) > 30:
@@ -1025,7 +1421,7 @@ def api_update_player():
             return jsonify({"error": "Cannot change role in Infection mode"}), 400
         if can_change:
             old_role = player["role"]
-            player["role"] = data["role"]
+            set_role(player, data["role"])
             player["original_role"] = data["role"]
             if old_role != data["role"]:
                 log_event("role_change", {"player": player["name"], "from": old_role, "to": data["role"]})
@@ -1035,7 +1431,7 @@ def api_update_player():
     
     if "status" in data and data["status"] in ["ready", "lobby", "dnd"]:
         old_status = player["status"]
-        player["status"] = data["status"]
+        set_status(player, data["status"])
         # Track ready state separately for toggle functionality
         if data["status"] == "ready":
             player["ready"] = True
@@ -1081,10 +1477,9 @@ def api_update_player():
         if phone:
             log_event("phone_update", {"player": player["name"], "has_phone": True})
     
-    player["last_seen"] = now()
-    player["last_ping"] = time.time()
-    socketio.emit("player_update", player, room="all")
-    return jsonify(player)
+    touch_player(player)
+    mark_player_dirty(player["device_id"])
+    return jsonify(public_player(player))
 
 @app.route("/api/player/photo", methods=["POST"])
 @login_required
@@ -1119,7 +1514,7 @@ def api_upload_photo():
     timestamp = int(time.time())
     base_filename = f"profile_{device_id}_{timestamp}_{uuid.uuid4().hex[:4]}.{ext}"
     filename = secure_filename(base_filename)
-    file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+    store_upload(file, os.path.join(app.config['UPLOAD_FOLDER'], filename))
     
     # Add cache-busting query param
     player["profile_pic"] = f"/uploads/{filename}?t={timestamp}"
@@ -1136,7 +1531,10 @@ def api_upload_photo():
 
 @app.route("/api/players", methods=["GET"])
 def api_get_players():
-    return jsonify(players)
+    # Serialize a copy so a player joining, leaving or gaining a key mid-response can't break it
+    with players_lock:
+        snapshot = {device_id: public_player(player) for device_id, player in players.items()}
+    return jsonify(snapshot)
 
 @app.route("/api/player/notifications", methods=["GET"])
 @login_required
@@ -1145,9 +1543,7 @@ def api_get_notifications():
     if device_id == "ADMIN":
         return jsonify([])
     player = get_player(device_id)
-    notifs = player.get("notifications", [])
-    player["notifications"] = []
-    return jsonify(notifs)
+    return jsonify(pop_notifications(player))
 
 # =============================================================================
 # EMERGENCY API
@@ -1174,7 +1570,7 @@ def api_trigger_emergency():
 def api_admin_trigger_emergency():
     """Admin/mod can trigger emergency for a specific player or as system alert"""
     data = request.json or {}
-    target_id = data.get("target_id", "").strip().upper()
+    target_id = norm_id(data.get("target_id", ""))
     reason = str(data.get("reason", "Admin triggered emergency"))[:200]
     
     # If target_id specified, trigger for that player
@@ -1278,13 +1674,12 @@ def api_upload_sighting():
     
     # Check sighting cooldown for this specific target
     cooldown_key = f"{device_id}_{target_id}"
-    current_time = time.time()
-    if cooldown_key in sighting_cooldowns:
-        time_since_last = current_time - sighting_cooldowns[cooldown_key]
-        if time_since_last < SIGHTING_COOLDOWN:
-            remaining = int(SIGHTING_COOLDOWN - time_since_last)
-            return jsonify({"error": f"Wait {remaining}s before spotting {target['name']} again"}), 400
-    sighting_cooldowns[cooldown_key] = current_time
+    current_time = time.monotonic()
+    time_since_last = current_time - sighting_cooldowns.get(cooldown_key, float("-inf"))
+    if time_since_last < SIGHTING_COOLDOWN:
+        remaining = int(SIGHTING_COOLDOWN - time_since_last)
+        return jsonify({"error": f"Wait {remaining}s before spotting {target['name']} again"}), 400
+    start_cooldown(sighting_cooldowns, sighting_cooldown_heap, cooldown_key, current_time, SIGHTING_COOLDOWN)
     
     if 'photo' not in request.files:
         return jsonify({"error": "No photo"}), 400
@@ -1305,7 +1700,7 @@ def api_upload_sighting():
     if os.path.exists(filepath):
         return jsonify({"error": "Please try again"}), 400
     
-    photo.save(filepath)
+    store_upload(photo, filepath)
     player["sightings"] += 1
     
     if mode_config["photo_required"] and player["role"] == "pred":
@@ -1315,61 +1710,50 @@ def api_upload_sighting():
     
     sighting_points = mode_config["sighting_points"]
     
-    log_event("sighting", {
+    sighting = {
         "spotter": player["name"],
         "target": target["name"],
         "photo": f"/uploads/{filename}"
-    })
+    }
+    log_event("sighting", sighting)
+    sightings_log.append({**sighting, "time_str": now_str()})
     
     notify_player(device_id, f"Sighting recorded! +{sighting_points} pts", "success")
     notify_player(target_id, f"You were spotted by {player['name']}!", "warning")
-    socketio.emit("sighting", {
-        "spotter": player["name"],
-        "target": target["name"],
-        "photo": f"/uploads/{filename}"
-    }, room="all")
+    socketio.emit("sighting", sighting, room="all")
     
     return jsonify({"success": True, "points": sighting_points})
 
 @app.route("/api/sightings", methods=["GET"])
 def api_get_sightings():
-    sightings = []
-    for event in events:
-        if event["type"] == "sighting" and "photo" in event["data"]:
-            sightings.append({
-                "spotter": event["data"]["spotter"],
-                "target": event["data"]["target"],
-                "photo": event["data"]["photo"],
-                "time_str": event["time_str"]
-            })
-    return jsonify(list(reversed(sightings)))
+    return jsonify(list(reversed(sightings_log)))
 
 # =============================================================================
 # TRACKER API
 # =============================================================================
 
-@app.route("/api/tracker/ping", methods=["POST"])
-def api_tracker_ping():
-    data = request.json or {}
-    device_id = data.get("device_id", "").strip().upper()
+def tracker_ping(data):
+    """Apply a tracker heartbeat and build its state reply, returning (payload, status)"""
+    device_id = norm_id(data.get("device_id", ""))
     if not device_id:
-        return jsonify({"error": "device_id required"}), 400
+        return {"error": "device_id required"}, 400
     
     player = get_player(device_id)
-    player["online"] = True
-    player["last_seen"] = now()
-    player["last_ping"] = time.time()
+    set_online(player, True)
+    touch_player(player)
     
     if player["status"] == "offline":
-        player["status"] = "lobby"
+        set_status(player, "lobby")
         log_event("tracker_connect", {"player": player["name"]})
     
     if "player_rssi" in data:
         player["last_rssi"] = data["player_rssi"]
         nearby = []
+        players_get = players.get
         for pid, rssi in data["player_rssi"].items():
-            if pid in players:
-                nearby.append({"id": pid, "name": players[pid]["name"], "rssi": rssi})
+            other = players_get(pid)
+            if other is not None:
+                nearby.append({"id": pid, "name": other["name"], "rssi": rssi})
         nearby.sort(key=lambda x: x["rssi"], reverse=True)
         player["nearby_players"] = nearby[:5]
         
@@ -1383,21 +1767,13 @@ def api_tracker_ping():
     if "beacon_rssi" in data:
         update_safe_zone(device_id, data["beacon_rssi"])
     
-    notifs = player.get("notifications", [])[-5:]
-    player["notifications"] = []
+    notifs = pop_notifications(player, 5)
     
     mode_config = get_mode_config()
     
     # Calculate consent badge for tracker display
     consent_flags = player.get("consent_flags", {})
-    badge_parts = []
-    if consent_flags.get("physical_tag", False):
-        badge_parts.append("T")
-    if not consent_flags.get("photo_visible", True):
-        badge_parts.append("NP")
-    if not consent_flags.get("location_share", True):
-        badge_parts.append("NL")
-    consent_badge = "".join(badge_parts) if badge_parts else "STD"
+    consent_badge = get_consent_badge(consent_flags)
     
     # Return None for empty team (avoids "null" string in ArduinoJson)
     team_value = player.get("team") if player.get("team") else None
@@ -1419,9 +1795,9 @@ def api_tracker_ping():
     captured_by_device = player.get("captured_by_device", "")
     
     # Only return active beacons
-    active_beacon_ids = [bid for bid, b in beacons.items() if b.get("active", True)]
+    active_beacon_ids = list(active_beacon_thresholds)
     
-    return jsonify({
+    return {
         "phase": game["phase"],
         "status": player["status"],
         "role": player["role"],
@@ -1446,13 +1822,18 @@ def api_tracker_ping():
         "my_captures": my_captures,
         "captured_by_name": captured_by_name,
         "captured_by_device": captured_by_device
-    })
+    }, 200
+
+@app.route("/api/tracker/ping", methods=["POST"])
+def api_tracker_ping():
+    payload, status = tracker_ping(request.json or {})
+    return jsonify(payload), status
 
 @app.route("/api/tracker/capture", methods=["POST"])
 def api_tracker_capture():
     data = request.json or {}
-    pred_id = data.get("pred_id", "").upper()
-    prey_id = data.get("prey_id", "").upper()
+    pred_id = norm_id(data.get("pred_id", ""))
+    prey_id = norm_id(data.get("prey_id", ""))
     rssi = data.get("rssi", -100)
     success, msg = process_capture(pred_id, prey_id, rssi)
     return jsonify({"success": success, "message": msg})
@@ -1460,7 +1841,7 @@ def api_tracker_capture():
 @app.route("/api/tracker/emergency", methods=["POST"])
 def api_tracker_emergency():
     data = request.json or {}
-    device_id = data.get("device_id", "").strip().upper()
+    device_id = norm_id(data.get("device_id", ""))
     reason = data.get("reason", "Emergency triggered from tracker")
     
     if not device_id or device_id not in players:
@@ -1493,7 +1874,7 @@ def api_get_beacons():
 @admin_required
 def api_add_beacon():
     data = request.json or {}
-    beacon_id = data.get("id", data.get("beacon_id", "")).strip().upper()
+    beacon_id = norm_id(data.get("id", data.get("beacon_id", "")))
     name = data.get("name", beacon_id)
     rssi = data.get("rssi", data.get("rssi_threshold", DEFAULT_SAFEZONE_RSSI))
     
@@ -1512,6 +1893,7 @@ def api_add_beacon():
         return jsonify({"error": "RSSI threshold must be between -100 and -30 (e.g., -75)"}), 400
     
     beacons[beacon_id] = {"name": name, "rssi": rssi, "active": True}
+    refresh_beacon_thresholds()
     log_event("beacon_add", {"id": beacon_id, "name": name, "rssi": rssi})
     return jsonify({"success": True})
 
@@ -1532,6 +1914,7 @@ def api_update_beacon(beacon_id):
         beacons[beacon_id]["rssi"] = data["rssi_threshold"]
     if "active" in data:
         beacons[beacon_id]["active"] = data["active"]
+    refresh_beacon_thresholds()
     
     return jsonify({"success": True})
 
@@ -1542,6 +1925,7 @@ def api_delete_beacon(beacon_id):
     beacon_id = beacon_id.upper()
     if beacon_id in beacons:
         del beacons[beacon_id]
+        refresh_beacon_thresholds()
         log_event("beacon_delete", {"id": beacon_id})
     return jsonify({"success": True})
 
@@ -1552,24 +1936,27 @@ def api_delete_beacon(beacon_id):
 @app.route("/api/game", methods=["GET"])
 def api_get_game():
     mode_config = get_mode_config()
-    state = game.copy()
-    state["mode_config"] = mode_config
-    state["mode_name"] = mode_config["name"]
-    state["player_count"] = len([p for p in players.values() if p["role"] != "unassigned"])
-    state["pred_count"] = len([p for p in players.values() if p["role"] == "pred"])
-    state["prey_count"] = len([p for p in players.values() if p["role"] == "prey"])
-    state["ready_count"] = len([p for p in players.values() if p["status"] == "ready"])
-    state["online_count"] = len([p for p in players.values() if p["online"]])
-    state["captured_count"] = len([p for p in players.values() if p["status"] == "captured"])
-    state["team_scores"] = team_scores
-    
-    if state["phase"] == "running" and state["end_time"] and not state["emergency"]:
-        remaining = (datetime.fromisoformat(state["end_time"]) - datetime.now()).total_seconds()
-        state["time_remaining"] = max(0, int(remaining))
-    else:
-        state["time_remaining"] = 0
+    pred_count = len(role_index["pred"])
+    prey_count = len(role_index["prey"])
+    
+    time_remaining = 0
+    if game["phase"] == "running" and end_deadline and not game["emergency"]:
+        time_remaining = max(0, int(end_deadline - time.monotonic()))
     
-    return jsonify(state)
+    # Built in one go rather than copying game and then adding keys one by one
+    return jsonify({
+        **game,
+        "mode_config": mode_config,
+        "mode_name": mode_config["name"],
+        "pred_count": pred_count,
+        "prey_count": prey_count,
+        "player_count": pred_count + prey_count,
+        "ready_count": len(status_index["ready"]),
+        "online_count": len(online_index),
+        "captured_count": len(status_index["captured"]),
+        "team_scores": team_scores,
+        "time_remaining": time_remaining,
+    })
 
 @app.route("/api/game/modes", methods=["GET"])
 def api_get_game_modes():
@@ -1592,9 +1979,8 @@ def api_set_game_mode():
     game["duration"] = mode_config["duration"]
     
     if mode_config["team_mode"]:
-        for p in players.values():
-            if p["role"] == "pred":
-                assign_team(p)
+        for p in role_players("pred"):
+            assign_team(p)
     else:
         for p in players.values():
             p["team"] = None
@@ -1616,6 +2002,7 @@ def api_update_settings():
         if key in data:
             game["settings"][key] = data[key]
     log_event("settings_update", game["settings"])
+    socketio.emit("settings_changed", game["settings"], room="trackers")
     return jsonify(game["settings"])
 
 @app.route("/api/game/ready_all", methods=["POST"])
@@ -1625,7 +2012,7 @@ def api_ready_all():
     count = 0
     for p in players.values():
         if p["role"] != "unassigned" and p["online"] and p["status"] == "lobby":
-            p["status"] = "ready"
+            set_status(p, "ready")
             count += 1
     log_event("bulk_ready", {"count": count})
     notify_all_players(f"Admin readied {count} players", "info")
@@ -1640,9 +2027,9 @@ def api_start_game():
     if game["emergency"]:
         return jsonify({"error": "Cannot start game during emergency"}), 400
     
-    pred_count = len([p for p in players.values() if p["role"] == "pred" and p["status"] == "ready"])
-    prey_count = len([p for p in players.values() if p["role"] == "prey" and p["status"] == "ready"])
-    online_count = len([p for p in players.values() if p["online"]])
+    pred_count = sum(1 for p in role_players("pred") if p["status"] == "ready")
+    prey_count = sum(1 for p in role_players("prey") if p["status"] == "ready")
+    online_count = len(online_index)
     
     if pred_count == 0:
         return jsonify({"error": "Need at least one ready predator"}), 400
@@ -1667,7 +2054,7 @@ def api_start_game():
     
     for p in players.values():
         if p["status"] == "ready" and p["role"] != "unassigned":
-            p["status"] = "active"
+            set_status(p, "active")
     
     log_event("game_start", {
         "duration": game["duration"], 
@@ -1679,16 +2066,16 @@ def api_start_game():
     socketio.emit("game_starting", {"countdown": game["countdown"], "mode": game["mode"]}, room="all")
     
     def start_after_countdown():
-        time.sleep(game["countdown"])
+        socketio.sleep(game["countdown"])
         if game["phase"] == "countdown":
             game["phase"] = "running"
             game["start_time"] = now()
-            game["end_time"] = (datetime.now() + timedelta(minutes=game["duration"])).isoformat()
+            set_end_time(game["duration"] * 60)
             log_event("game_running", {"duration": game["duration"], "mode": game["mode"]})
             notify_all_players(f"🎮 {mode_config['name']} STARTED! Good luck!", "success")
             socketio.emit("game_started", {"mode": game["mode"]}, room="all")
     
-    threading.Thread(target=start_after_countdown, daemon=True).start()
+    socketio.start_background_task(start_after_countdown)
     return jsonify({"success": True})
 
 @app.route("/api/game/pause", methods=["POST"])
@@ -1697,9 +2084,8 @@ def api_pause_game():
     if game["phase"] == "running":
         game["phase"] = "paused"
         # Store remaining time so we can restore it on resume
-        if game.get("end_time"):
-            remaining = (datetime.fromisoformat(game["end_time"]) - datetime.now()).total_seconds()
-            game["paused_remaining"] = max(0, remaining)
+        if end_deadline:
+            game["paused_remaining"] = max(0, end_deadline - time.monotonic())
         log_event("game_pause", {})
         notify_all_players("Game PAUSED", "warning")
         socketio.emit("game_paused", {}, room="all")
@@ -1720,7 +2106,7 @@ def api_resume_game():
         game["phase"] = "running"
         # Restore timer from paused state
         if game.get("paused_remaining"):
-            game["end_time"] = (datetime.now() + timedelta(seconds=game["paused_remaining"])).isoformat()
+            set_end_time(game["paused_remaining"])
             del game["paused_remaining"]
         log_event("game_resume", {})
         notify_all_players("Game RESUMED!", "success")
@@ -1731,7 +2117,7 @@ def api_resume_game():
 @mod_required
 def api_end_game():
     game["phase"] = "ended"
-    game["end_time"] = now()
+    set_end_time(0)
     
     # Update global stats
     game_stats["total_games_played"] += 1
@@ -1741,12 +2127,13 @@ def api_end_game():
     if game["duration"] > game_stats["longest_game_minutes"]:
         game_stats["longest_game_minutes"] = game["duration"]
     
-    current_players = len([p for p in players.values() if p["role"] != "unassigned"])
+    current_players = len(role_index["pred"]) + len(role_index["prey"])
     if current_players > game_stats["most_players_in_game"]:
         game_stats["most_players_in_game"] = current_players
     
     # Award end-game achievements
     mode_config = get_mode_config()
+    prey_count = len(role_index["prey"])
     
     for device_id, player in players.items():
         # Survivor achievement (prey never caught)
@@ -1765,7 +2152,6 @@ def api_end_game():
         
         # Last standing (infection mode)
         if mode_config["infection"] and player["role"] == "prey":
-            prey_count = len([p for p in players.values() if p["role"] == "prey"])
             if prey_count == 1:
                 award_achievement(device_id, "last_standing")
     
@@ -1868,6 +2254,7 @@ def api_apply_preset(preset_name):
     game["mode"] = preset["mode"]
     game["duration"] = preset["duration"]
     game["settings"]["capture_rssi"] = preset["capture_rssi"]
+    socketio.emit("settings_changed", game["settings"], room="trackers")
     
     log_event("preset_applied", {"preset": preset_name, "mode": preset["mode"]})
     notify_all_players(f"Game preset applied: {preset_name.replace('_', ' ').title()}", "info")
@@ -1881,15 +2268,15 @@ def api_reset_game():
     game["phase"] = "lobby"
     game["mode"] = "classic"
     game["start_time"] = None
-    game["end_time"] = None
+    set_end_time(None)
     game["emergency"] = False
     game["emergency_by"] = None
     game["emergency_reason"] = ""
     game["emergency_time"] = None
     
     for p in players.values():
-        p["status"] = "lobby" if p["online"] else "offline"
-        p["role"] = "unassigned"
+        set_status(p, "lobby" if p["online"] else "offline")
+        set_role(p, "unassigned")
         p["original_role"] = "unassigned"
         p["team"] = None
         p["captures"] = 0
@@ -1914,6 +2301,8 @@ def api_reset_game():
     
     capture_cooldowns.clear()
     sighting_cooldowns.clear()
+    capture_cooldown_heap.clear()
+    sighting_cooldown_heap.clear()
     bounties.clear()
     
     # Clear sighting photos (keep profile pics)
@@ -1924,10 +2313,11 @@ def api_reset_game():
             os.remove(f)
         except:
             pass
+    sightings_log.clear()
     
-    # Clear events (keep some history)
-    global events
-    events = events[-50:]  # Keep last 50 events
+    # Clear events (keep last 50 for some history)
+    while len(events) > 50:
+        events.popleft()
     
     log_event("game_reset", {"sightings_cleared": len(sighting_files)})
     notify_all_players("Game reset to lobby", "info")
@@ -1974,9 +2364,8 @@ def api_get_my_full_status():
         return jsonify({"error": "Player not found"}), 404
     
     # Update last seen
-    player["last_seen"] = now()
-    player["last_ping"] = time.time()
-    player["online"] = True
+    touch_player(player)
+    set_online(player, True)
     
     # Calculate current points
     calculate_points(player)
@@ -1984,7 +2373,7 @@ def api_get_my_full_status():
     mode_config = get_mode_config()
     
     return jsonify({
-        "player": player,
+        "player": public_player(player),
         "game_phase": game["phase"],
         "game_mode": game["mode"],
         "mode_config": mode_config,
@@ -2006,19 +2395,18 @@ def api_get_stats():
     total_sightings = sum(p["sightings"] for p in players.values())
     
     # Top performers
-    top_pred = max((p for p in players.values() if p["role"] == "pred"), 
-                   key=lambda x: x["captures"], default=None)
-    top_prey = max((p for p in players.values() if p["role"] == "prey"), 
-                   key=lambda x: x["escapes"], default=None)
-    never_caught = [p["name"] for p in players.values() 
-                    if p["role"] == "prey" and p["times_captured"] == 0]
+    preds = role_players("pred")
+    prey = role_players("prey")
+    top_pred = max(preds, key=lambda x: x["captures"], default=None)
+    top_prey = max(prey, key=lambda x: x["escapes"], default=None)
+    never_caught = [p["name"] for p in prey if p["times_captured"] == 0]
     
     stats = {
         "game_mode": game["mode"],
         "game_mode_name": mode_config["name"],
         "phase": game["phase"],
-        "total_players": len([p for p in players.values() if p["role"] != "unassigned"]),
-        "online_players": len([p for p in players.values() if p["online"]]),
+        "total_players": len(preds) + len(prey),
+        "online_players": len(online_index),
         "total_captures": total_captures,
         "total_escapes": total_escapes,
         "total_sightings": total_sightings,
@@ -2031,7 +2419,7 @@ def api_get_stats():
     }
     
     if mode_config["infection"]:
-        stats["prey_remaining"] = len([p for p in players.values() if p["role"] == "prey"])
+        stats["prey_remaining"] = len(prey)
         stats["total_infections"] = sum(p.get("infections", 0) for p in players.values())
     
     if mode_config["team_mode"]:
@@ -2049,7 +2437,7 @@ def api_get_game_history():
         filtered = [e for e in events if e["type"] == event_type]
         return jsonify(filtered[-limit:])
     
-    return jsonify(events[-limit:])
+    return jsonify(recent(events, limit))
 
 # =============================================================================
 # MESSAGING API
@@ -2058,11 +2446,15 @@ def api_get_game_history():
 @app.route("/api/events", methods=["GET"])
 def api_get_events():
     limit = request.args.get("limit", 100, type=int)
-    return jsonify(events[-limit:])
+    return jsonify(recent(events, limit))
 
 @app.route("/api/leaderboard", methods=["GET"])
 def api_get_leaderboard():
-    return jsonify(get_leaderboard())
+    # Dashboards refetch this on every event; answer 304 when nothing changed
+    resp = jsonify(cached_leaderboard())
+    resp.cache_control.no_cache = True
+    resp.add_etag()
+    return resp.make_conditional(request)
 
 @app.route("/api/messages", methods=["GET"])
 @login_required
@@ -2070,30 +2462,36 @@ def api_get_messages():
     device_id = session["device_id"]
     
     if session.get("is_admin"):
-        return jsonify(messages[-100:])
+        return jsonify(recent(messages, 100))
     
     player = get_player(device_id)
-    visible = []
     mode_config = get_mode_config()
     
-    for msg in messages[-100:]:
-        if msg["to"] == "all":
-            visible.append(msg)
-        elif msg["to"].startswith("team_") and mode_config["team_mode"]:
-            # Team mode: team_Alpha, team_Beta, etc.
-            if msg["to"] == f"team_{player.get('team')}":
-                visible.append(msg)
-        elif msg["to"].startswith("role_"):
-            # Role-based: role_pred, role_prey
-            if msg["to"] == f"role_{player['role']}":
-                visible.append(msg)
-        elif msg["to"] == "team" and msg.get("team") == player["role"]:
-            # Legacy support
-            visible.append(msg)
-        elif msg["to"] == device_id or msg["from_id"] == device_id:
-            visible.append(msg)
-    
-    return jsonify(visible)
+    # Everything sent to all, to the player's role, to them directly or by them
+    box_names = ["all", f"role_{player['role']}", device_id]
+    if mode_config["team_mode"]:
+        box_names.append(f"team_{player.get('team')}")
+    visible = {}
+    for name in box_names:
+        for msg in message_boxes.get(name, ()):
+            visible[msg["id"]] = msg
+    
+    return jsonify([visible[i] for i in sorted(visible)[-100:]])
+
+def message_rooms(msg):
+    """Socket.IO rooms that should receive msg live, matching what api_get_messages shows"""
+    to = msg["to"]
+    if to == "all":
+        return "all"
+    if to.startswith("role_"):
+        rooms = list(role_index.get(to[5:], ()))
+    elif to.startswith("team_"):
+        rooms = [pid for pid, p in players.items() if f"team_{p.get('team')}" == to]
+    else:
+        rooms = [to]  # Direct message; every client joins its device_id room
+    # The sender and admin (device_id "ADMIN") always see it
+    rooms += [msg["from_id"], "ADMIN"]
+    return rooms
 
 @app.route("/api/messages", methods=["POST"])
 @login_required
@@ -2125,8 +2523,14 @@ def api_send_message():
             to = f"team_{team}"  # Route to specific team
         else:
             to = f"role_{role}"  # Route to role (pred/prey)
-    
+
+    # Only known recipients, so random "to" values can't grow message_boxes without bound
+    allowed = {"all", f"team_{team}" if team else None, f"role_{role}" if role else None}
+    if not isinstance(to, str) or (to not in allowed and to not in players):
+        return jsonify({"error": "Invalid recipient"}), 400
+
     msg = {
+        "id": next(message_ids),
         "from_id": device_id,
         "from_name": from_name,
         "to": to,
@@ -2137,10 +2541,11 @@ def api_send_message():
     }
     
     messages.append(msg)
-    if len(messages) > MAX_MESSAGES:
-        messages.pop(0)
+    message_boxes[to].append(msg)
+    if to != device_id:
+        message_boxes[device_id].append(msg)  # Senders always see their own messages
     
-    socketio.emit("message", msg, room="all")
+    socketio.emit("message", msg, to=message_rooms(msg))
     
     if device_id == "ADMIN" and to == "all":
         notify_all_players(msg_content, "info")
@@ -2213,7 +2618,7 @@ def api_force_role():
     
     player = players[device_id]
     old_role = player["role"]
-    player["role"] = new_role
+    set_role(player, new_role)
     player["original_role"] = new_role
     
     log_event("force_role", {"player": player["name"], "from": old_role, "to": new_role})
@@ -2233,7 +2638,7 @@ def api_release_player():
     data = request.json or {}
     device_id = data.get("device_id", "").upper()
     if device_id in players and players[device_id]["status"] == "captured":
-        players[device_id]["status"] = "active"
+        set_status(players[device_id], "active")
         players[device_id]["captured_by"] = None
         log_event("mod_release", {"player": players[device_id]["name"]})
         notify_player(device_id, "Moderator released you!", "success")
@@ -2259,7 +2664,11 @@ def api_kick_player():
         if device_id in moderators:
             moderators.remove(device_id)
         
-        del players[device_id]
+        role_index[players[device_id]["role"]].discard(device_id)
+        status_index[players[device_id]["status"]].discard(device_id)
+        online_index.discard(device_id)
+        with players_lock:
+            del players[device_id]
         log_event("player_kick", {"player": name})
         notify_all_players(f"{name} was removed from the game", "info")
     return jsonify({"success": True})
@@ -2276,7 +2685,7 @@ def api_report_player():
         return jsonify({"error": "Admin cannot report"}), 400
     
     data = request.json or {}
-    target_id = data.get("target_id", "").strip().upper()
+    target_id = norm_id(data.get("target_id", ""))
     reason = str(data.get("reason", ""))[:500].strip()
     category = data.get("category", "other")
     
@@ -2295,6 +2704,7 @@ def api_report_player():
     
     reporter = players.get(device_id, {})
     target = players.get(target_id, {})
+    timestamp, time_str = now_stamps()
     
     report = {
         "id": len(player_reports) + 1,
@@ -2304,8 +2714,8 @@ def api_report_player():
         "target_name": target.get("name", "Unknown"),
         "category": category,
         "reason": reason,
-        "timestamp": now(),
-        "time_str": now_str(),
+        "timestamp": timestamp,
+        "time_str": time_str,
         "reviewed": False,
         "action_taken": None
     }
@@ -2393,7 +2803,7 @@ def api_update_consent():
             player["consent_flags"][key] = bool(data[key])
     
     log_event("consent_update", {"player": player["name"], "flags": player["consent_flags"]})
-    socketio.emit("player_update", player, room="all")
+    mark_player_dirty(player["device_id"])
     
     return jsonify({"success": True, "consent_flags": player["consent_flags"]})
 
@@ -2435,18 +2845,9 @@ def api_consent_summary():
     for device_id, player in players.items():
         if player["role"] != "unassigned":
             flags = player.get("consent_flags", {})
-            # Create consent indicator string for badge
-            indicators = []
-            if flags.get("physical_tag", False):
-                indicators.append("T")  # Touch OK
-            if not flags.get("photo_visible", True):
-                indicators.append("NP")  # No Photo
-            if not flags.get("location_share", True):
-                indicators.append("NL")  # No Location
-            
             summary[device_id] = {
                 "name": player["name"],
-                "consent_badge": "".join(indicators) if indicators else "STD",  # Standard
+                "consent_badge": get_consent_badge(flags),
                 "flags": flags
             }
     return jsonify(summary)
@@ -2488,7 +2889,7 @@ def ws_connect():
         device_id = session["device_id"]
         join_room(device_id)
         if device_id in players:
-            players[device_id]["online"] = True
+            set_online(players[device_id], True)
             players[device_id]["last_ping"] = time.time()
         # Send confirmation to client with their identity
         emit("session_confirmed", {
@@ -2497,11 +2898,26 @@ def ws_connect():
             "is_admin": session.get("is_admin", False)
         })
 
+@socketio.on("tracker_ping")
+def ws_tracker_ping(data):
+    """Same as POST /api/tracker/ping over an open socket; the reply comes back as tracker_state"""
+    payload, status = tracker_ping(data if isinstance(data, dict) else {})
+    if status == 200:
+        device_id = norm_id(data["device_id"])
+        # Device rooms carry private chat and notifications, so only the device's own
+        # session or a tracker holding TRACKER_KEY may subscribe; others just get the reply
+        key = data.get("tracker_key")
+        if session.get("device_id") == device_id or (
+                TRACKER_KEY and isinstance(key, str) and secrets.compare_digest(key, TRACKER_KEY)):
+            join_room(device_id)  # Live notifications for this tracker
+            join_room("trackers")  # settings_changed pushes
+    emit("tracker_state", payload)
+
 @socketio.on("heartbeat")
 def ws_heartbeat():
     if "device_id" in session and session["device_id"] in players:
         players[session["device_id"]]["last_ping"] = time.time()
-        players[session["device_id"]]["online"] = True
+        set_online(players[session["device_id"]], True)
     emit("heartbeat_ack", {"server_time": now_str()})
 
 @app.route("/api/admin/clear_uploads", methods=["POST"])
@@ -2564,8 +2980,7 @@ def save_game_state():
     """Save current game state to file for recovery"""
     state = {
         "game": game,
-        "players": {k: {key: val for key, val in v.items() if key != "notifications"} 
-                    for k, v in players.items()},
+        "players": {k: public_player(v) for k, v in players.items()},
         "beacons": beacons,
         "game_stats": game_stats,
         "player_achievements": {k: list(v) for k, v in player_achievements.items()},
@@ -2607,7 +3022,10 @@ def graceful_shutdown(signum=None, frame=None):
     print(f"\n[{now_str()}] Shutting down gracefully...")
     
     background_thread_stop = True
+    background_wake.set()
     save_game_state()
+    if event_log_thread is not None:
+        event_log_thread.join(timeout=2)  # Let queued events reach disk
     
     # Notify all connected clients
     try: